@@ -0,0 +1,48 @@
+"""
+config.py — environment configuration shared by mail.py, sms.py and teams.py.
+
+`.env` is parsed once, when this module is first imported, and every value is exposed as a
+module constant. Values are not validated at import so that each script only fails on the
+variables it actually needs; call `require("NAME")` to get a value or a ValueError.
+"""
+
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Email (Azure Communication Services)
+CONNECTION_STRING_EMAIL = os.getenv("CONNECTION_STRING_EMAIL")
+SENDER_ADDRESS = os.getenv("SENDER_ADDRESS")
+RECIPIENT_ADDRESS = os.getenv("RECIPIENT_ADDRESS")
+
+# SMS (Azure Communication Services)
+CONNECTION_STRING_SMS = os.getenv("CONNECTION_STRING_SMS")
+SMS_FROM = os.getenv("SMS_FROM")
+SMS_TO = os.getenv("SMS_TO")
+
+# Teams / Microsoft Graph
+TEAMS_CLIENT_ID = os.getenv("TEAMS_CLIENT_ID")
+TEAMS_CLIENT_SECRET = os.getenv("TEAMS_CLIENT_SECRET")
+TEAMS_TENANT_ID = os.getenv("TEAMS_TENANT_ID")
+TEAMS_SENDER_UPN = os.getenv("TEAMS_SENDER_UPN")
+TEAMS_RECIPIENT_UPN = os.getenv("TEAMS_RECIPIENT_UPN")
+TEAMS_DEFAULT_MESSAGE = os.getenv("TEAMS_DEFAULT_MESSAGE", "Hello from ACS Lab")
+TEAMS_AUTH_MODE = os.getenv("TEAMS_AUTH_MODE", "app").lower()
+
+
+SETTINGS = frozenset([
+    "CONNECTION_STRING_EMAIL", "SENDER_ADDRESS", "RECIPIENT_ADDRESS",
+    "CONNECTION_STRING_SMS", "SMS_FROM", "SMS_TO",
+    "TEAMS_CLIENT_ID", "TEAMS_CLIENT_SECRET", "TEAMS_TENANT_ID", "TEAMS_SENDER_UPN",
+    "TEAMS_RECIPIENT_UPN", "TEAMS_DEFAULT_MESSAGE", "TEAMS_AUTH_MODE",
+])
+
+
+def require(name: str) -> str:
+    if name not in SETTINGS:
+        raise KeyError(f"Unknown setting '{name}'.")
+    value = globals()[name]
+    if not value:
+        raise ValueError(f"{name} not found in environment variables.")
+    return value
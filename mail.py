@@ -1,47 +1,97 @@
 from azure.communication.email import EmailClient
-from dotenv import load_dotenv
-import os
+from azure.communication.email.aio import EmailClient as AsyncEmailClient
+from azure.core.pipeline.transport import AioHttpTransport, RequestsTransport
+import asyncio
+import config
+
+POLLING_INTERVAL = 1
+
+# Shared across every EmailClient built in this process so repeat sends reuse the
+# pooled HTTPS connection to ACS instead of opening a new one per client.
+_transport = RequestsTransport()
+_client = None
+
+
+def _default_client() -> EmailClient:
+    global _client
+    if _client is None:
+        _client = EmailClient.from_connection_string(
+            config.require("CONNECTION_STRING_EMAIL"), transport=_transport
+        )
+    return _client
+
+
+def build_message(sender: str, recipient: str, *, subject: str, html: str, text: str) -> dict:
+    return {
+        "senderAddress": sender,
+        "recipients": {
+            "to": [{"address": recipient}]
+        },
+        "content": {
+            "subject": subject,
+            "plainText": text,
+            "html": html,
+        },
+    }
+
+
+def _send_one(client: EmailClient, message: dict) -> dict:
+    poller = client.begin_send(message, polling_interval=POLLING_INTERVAL)
+    return poller.result()
+
+
+def send_email(client: EmailClient, sender: str, recipient: str, *, subject: str, html: str, text: str) -> dict:
+    return _send_one(client, build_message(sender, recipient, subject=subject, html=html, text=text))
+
+
+async def _send_one_async(client: AsyncEmailClient, message: dict) -> dict:
+    poller = await client.begin_send(message, polling_interval=POLLING_INTERVAL)
+    return await poller.result()
+
+
+async def send_many_async(messages: list) -> list:
+    """Send messages concurrently on one event loop; wall time tracks the slowest poll, not the sum.
+
+    Returns one entry per message, in order: the send result, or the exception that send raised,
+    so one failure neither hides nor cancels the sends ACS already accepted.
+    """
+    # Async clients are bound to the running loop, so this one lives for the batch rather than the process.
+    client = AsyncEmailClient.from_connection_string(
+        config.require("CONNECTION_STRING_EMAIL"), transport=AioHttpTransport()
+    )
+    async with client:
+        return await asyncio.gather(
+            *[_send_one_async(client, message) for message in messages],
+            return_exceptions=True,
+        )
+
+
+def send_many(messages: list) -> list:
+    return asyncio.run(send_many_async(messages))
+
 
 def main():
     try:
-        load_dotenv()
-
-        connection_string_email = os.getenv("CONNECTION_STRING_EMAIL")
-        if not connection_string_email:
-            raise ValueError("CONNECTION_STRING_EMAIL not found in environment variables.")
-        sender_address = os.getenv("SENDER_ADDRESS")
-        if not sender_address:
-            raise ValueError("SENDER_ADDRESS not found in environment variables.")
-        recipient_address = os.getenv("RECIPIENT_ADDRESS")
-        if not recipient_address:
-            raise ValueError("RECIPIENT_ADDRESS not found in environment variables.")
-        client = EmailClient.from_connection_string(connection_string_email)
-
-        message = {
-            "senderAddress": sender_address,
-            "recipients": {
-                "to": [{"address": recipient_address}]
-            },
-            "content": {
-                "subject": "Test Email",
-                "plainText": """Hello world via email.""",
-                "html": """
+        result = send_email(
+            _default_client(),
+            config.require("SENDER_ADDRESS"),
+            config.require("RECIPIENT_ADDRESS"),
+            subject="Test Email",
+            text="""Hello world via email.""",
+            html="""
                 <html>
                     <body>
                         <h1>
                             Hello world via email.
                         </h1>
                     </body>
-                </html>"""
-            },
-        }
-
-        poller = client.begin_send(message)
-        result = poller.result()
+                </html>""",
+        )
         print("Message sent: ", result["messageId"])
 
     except Exception as ex:
         print(ex)
 
+
 if __name__ == "__main__":
     main()
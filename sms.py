@@ -1,25 +1,35 @@
-import os
 from azure.communication.sms import SmsClient
-from dotenv import load_dotenv
-
-try:
-    load_dotenv()
-    connection_string_sms = os.getenv("CONNECTION_STRING_SMS")
-    if not connection_string_sms:
-        raise ValueError("CONNECTION_STRING_SMS not found in environment variables.")
-    sms_from = os.getenv("SMS_FROM")
-    if not sms_from:
-        raise ValueError("SMS_FROM not found in environment variables.")
-    sms_to = os.getenv("SMS_TO")
-    if not sms_to:
-        raise ValueError("SMS_TO not found in environment variables.")
-
-    sms_client = SmsClient.from_connection_string(connection_string_sms)
-
-    sms_responses = sms_client.send(
-        from_=sms_from,
-        to=sms_to,
-        message='''Hello World 👋🏻 via SMS'''
+import config
+
+_client = None
+
+
+def _default_client() -> SmsClient:
+    global _client
+    if _client is None:
+        _client = SmsClient.from_connection_string(config.require("CONNECTION_STRING_SMS"))
+    return _client
+
+
+def send_sms(to: str, message: str) -> list:
+    return send_many([to], message)
+
+
+def send_many(recipients: list, message: str) -> list:
+    """Send one message to every recipient; ACS accepts a list of numbers, so this is a single request."""
+    return _default_client().send(
+        from_=config.require("SMS_FROM"),
+        to=recipients,
+        message=message
     )
-except Exception as ex:
-    print(ex)
+
+
+def main():
+    try:
+        send_sms(config.require("SMS_TO"), '''Hello World 👋🏻 via SMS''')
+    except Exception as ex:
+        print(ex)
+
+
+if __name__ == "__main__":
+    main()
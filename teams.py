@@ -5,13 +5,14 @@ Required `.env` variables:
 - TEAMS_CLIENT_ID
 - TEAMS_CLIENT_SECRET
 - TEAMS_TENANT_ID
+- TEAMS_SENDER_UPN
 - TEAMS_RECIPIENT_UPN
-- (optional) TEAMS_SENDER_UPN
 - (optional) TEAMS_DEFAULT_MESSAGE
 
 Usage:
     python teams.py                  # sends TEAMS_DEFAULT_MESSAGE
     python teams.py "Custom message"   # sends the provided message
+    python teams.py "First" "Second"   # sends several messages concurrently over one HTTP/2 connection
 
 Notes:
 - The Azure AD app requires admin consent for application Graph permissions that allow creating chats and sending messages.
@@ -20,102 +21,416 @@ Notes:
 
 import os
 import sys
-import requests
+import asyncio
+import json
+import socket
+import threading
+import time
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import urllib.parse
-from dotenv import load_dotenv
+import httpx
 import msal
+import orjson
+import config
 
 GRAPH_RESOURCE = "https://graph.microsoft.com/"
 GRAPH_SCOPE = [GRAPH_RESOURCE + ".default"]
+LOGIN_HOST = "login.microsoftonline.com"
+GRAPH_HOST = "graph.microsoft.com"
+_GRAPH_V1_URL = GRAPH_RESOURCE + "v1.0/"
+_BATCH_URL = _GRAPH_V1_URL + "$batch"
+_CHATS_URL = _GRAPH_V1_URL + "chats"
+_CHAT_MESSAGES_URL = _CHATS_URL + "/{}/messages"
+_USER_BIND = _GRAPH_V1_URL + "users('{}')"
+_MESSAGE_BODY = {"contentType": "html"}
+# 1:1 chat creation body serialized once; create_chat fills in the two member ids with %.
+_CHAT_TEMPLATE = orjson.dumps({
+    "chatType": "oneOnOne",
+    "members": [
+        {
+            "@odata.type": "#microsoft.graph.aadUserConversationMember",
+            "roles": ["owner"],
+            "user@odata.bind": _USER_BIND.format("%s")
+        },
+        {
+            "@odata.type": "#microsoft.graph.aadUserConversationMember",
+            "roles": ["owner"],
+            "user@odata.bind": _USER_BIND.format("%s")
+        }
+    ]
+}).decode()
+# Shared by the sync and async Graph clients.
+GRAPH_TIMEOUT = 30.0
+GRAPH_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+# Statuses meaning the $batch endpoint itself is unavailable, as opposed to auth or server errors.
+BATCH_UNSUPPORTED_STATUSES = frozenset([400, 404, 405])
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".acs-lab")
+TOKEN_CACHE_PATH = os.path.join(CACHE_DIR, "token-cache.json")
+GRAPH_CACHE_PATH = os.path.join(CACHE_DIR, "graph-cache.json")
+# Object ids never change for a UPN, but re-check occasionally in case the account was recreated.
+USER_ID_TTL_SECONDS = 7 * 24 * 60 * 60
 
 
-def get_access_token(tenant_id: str, client_id: str, client_secret: str) -> str:
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    app = msal.ConfidentialClientApplication(
+def _prefetch_dns() -> None:
+    # Warm the resolver cache for both hosts while MSAL and the token cache are still loading.
+    for host in (LOGIN_HOST, GRAPH_HOST):
+        try:
+            socket.getaddrinfo(host, 443)
+        except OSError:
+            pass  # the real request will surface the error
+
+
+def create_graph_client() -> httpx.Client:
+    """Return an HTTP/2 client whose single multiplexed connection is shared by all Graph calls."""
+    return httpx.Client(http2=True, timeout=GRAPH_TIMEOUT, limits=GRAPH_LIMITS)
+
+
+def _should_retry(method: str, status_code: int, headers=None) -> bool:
+    # Retry GETs on any transient status, but POSTs (not idempotent) only when throttled.
+    # A 429 is rejected before Graph does any work. A 503 can follow a real backend failure
+    # after the request was accepted, so it is only replayed when it carries Retry-After.
+    if method == "POST":
+        return status_code == 429 or (status_code == 503 and "Retry-After" in (headers or {}))
+    return status_code in RETRY_STATUSES
+
+
+def _should_retry_error(method: str, exc: httpx.TransportError) -> bool:
+    # A GET can always be replayed. A POST only when the connection was never established,
+    # because after that the server may already have processed the request.
+    if method == "POST":
+        return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout))
+    return True
+
+
+def _retry_delay(headers, attempt: int) -> float:
+    retry_after = str(headers.get("Retry-After", ""))
+    if retry_after.isdigit():
+        return float(retry_after)
+    return BACKOFF_FACTOR * (2 ** attempt)
+
+
+def _request(client: httpx.Client, method: str, url: str, **kwargs) -> httpx.Response:
+    # The last response is returned as-is so callers report Graph's own error body.
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            resp = client.request(method, url, **kwargs)
+        except httpx.TransportError as exc:
+            if not _should_retry_error(method, exc) or attempt == MAX_RETRIES:
+                raise
+            time.sleep(_retry_delay({}, attempt))
+            continue
+        if not _should_retry(method, resp.status_code, resp.headers) or attempt == MAX_RETRIES:
+            return resp
+        time.sleep(_retry_delay(resp.headers, attempt))
+
+
+@functools.lru_cache(maxsize=8)
+def _auth_headers(access_token: str) -> dict:
+    # Built once per token; httpx merges these into its own headers per call, so sharing is safe.
+    return {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
+
+
+class ChatNotFoundError(RuntimeError):
+    """Raised when Graph reports that a (possibly cached) chat id no longer exists."""
+
+
+def _load_token_cache() -> msal.SerializableTokenCache:
+    cache = msal.SerializableTokenCache()
+    if os.path.exists(TOKEN_CACHE_PATH):
+        with open(TOKEN_CACHE_PATH) as f:
+            cache.deserialize(f.read())
+    return cache
+
+
+def _save_token_cache(cache: msal.SerializableTokenCache) -> None:
+    if not cache.has_state_changed:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # The cache holds bearer (and for delegated mode, refresh) tokens: keep it owner-only.
+    fd = os.open(TOKEN_CACHE_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(cache.serialize())
+    os.chmod(TOKEN_CACHE_PATH, 0o600)
+
+
+@functools.lru_cache(maxsize=1)
+def _shared_token_cache() -> msal.SerializableTokenCache:
+    return _load_token_cache()
+
+
+# MSAL apps are cached per process so authority discovery and app setup happen once,
+# and every app shares the token cache loaded from disk.
+@functools.lru_cache(maxsize=4)
+def _get_cca(tenant_id: str, client_id: str, client_secret: str) -> msal.ConfidentialClientApplication:
+    return msal.ConfidentialClientApplication(
         client_id,
-        authority=authority,
+        authority=f"https://{LOGIN_HOST}/{tenant_id}",
         client_credential=client_secret,
+        token_cache=_shared_token_cache(),
     )
+
+
+@functools.lru_cache(maxsize=4)
+def _get_pca(tenant_id: str, client_id: str) -> msal.PublicClientApplication:
+    return msal.PublicClientApplication(
+        client_id,
+        authority=f"https://{LOGIN_HOST}/{tenant_id}",
+        token_cache=_shared_token_cache(),
+    )
+
+
+def get_access_token(tenant_id: str, client_id: str, client_secret: str) -> str:
+    app = _get_cca(tenant_id, client_id, client_secret)
+    # Since MSAL 1.23 this returns a still-valid cached token (e.g. from a previous run)
+    # before going to the network.
     result = app.acquire_token_for_client(scopes=GRAPH_SCOPE)
+    _save_token_cache(_shared_token_cache())
     if "access_token" in result:
         return result["access_token"]
     raise RuntimeError(f"Could not obtain access token: {result}")
 
 
 def get_delegated_token(tenant_id: str, client_id: str, scopes: list) -> str:
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    app = msal.PublicClientApplication(client_id, authority=authority)
-    flow = app.initiate_device_flow(scopes=scopes)
-    if "user_code" not in flow:
-        raise RuntimeError(f"Failed to initiate device flow: {flow}")
-    # Print instructions to the terminal for the user to authenticate
-    print(flow["message"])  # contains URL and user code
-    result = app.acquire_token_by_device_flow(flow)
+    app = _get_pca(tenant_id, client_id)
+    # A cached account lets MSAL refresh silently instead of repeating the device-code prompt.
+    result = None
+    accounts = app.get_accounts()
+    if accounts:
+        result = app.acquire_token_silent(scopes, account=accounts[0])
+    if not result:
+        flow = app.initiate_device_flow(scopes=scopes)
+        if "user_code" not in flow:
+            raise RuntimeError(f"Failed to initiate device flow: {flow}")
+        # Print instructions to the terminal for the user to authenticate
+        print(flow["message"])  # contains URL and user code
+        result = app.acquire_token_by_device_flow(flow)
+    _save_token_cache(_shared_token_cache())
     if "access_token" in result:
         return result["access_token"]
     raise RuntimeError(f"Failed to acquire token by device flow: {result}")
 
 
-def get_user_id(access_token: str, user_upn: str) -> str:
+def _load_graph_cache() -> dict:
+    try:
+        with open(GRAPH_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    cache.setdefault("users", {})
+    cache.setdefault("chats", {})
+    return cache
+
+
+def _save_graph_cache(cache: dict) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(GRAPH_CACHE_PATH, "w") as f:
+        json.dump(cache, f, indent=2)
+
+
+def _cached_user_id(cache: dict, user_upn: str):
+    entry = cache["users"].get(user_upn)
+    if entry and time.time() - entry["ts"] < USER_ID_TTL_SECONDS:
+        return entry["id"]
+    return None
+
+
+@functools.lru_cache(maxsize=1024)
+def _user_path(user_upn: str) -> str:
     # Use the user principal name directly in the users/{id|userPrincipalName} path.
     # URL-encode the UPN to support characters like '#' (external guest accounts):
-    encoded_upn = urllib.parse.quote(user_upn, safe='')
-    url = GRAPH_RESOURCE + "v1.0/users/" + encoded_upn
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    resp = requests.get(url, headers=headers)
+    return "users/" + urllib.parse.quote(user_upn, safe='')
+
+
+def _fetch_user_id(client: httpx.Client, access_token: str, user_upn: str) -> str:
+    url = _GRAPH_V1_URL + _user_path(user_upn)
+    headers = _auth_headers(access_token)
+    resp = _request(client, "GET", url, headers=headers)
     if resp.status_code == 200:
         return resp.json().get("id")
     raise RuntimeError(f"Failed to resolve user '{user_upn}': {resp.status_code} {resp.text}")
 
 
-def create_chat(access_token: str, sender_id: str, recipient_id: str) -> str:
-    url = GRAPH_RESOURCE + "v1.0/chats"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    payload = {
-        "chatType": "oneOnOne",
-        "members": [
-            {
-                "@odata.type": "#microsoft.graph.aadUserConversationMember",
-                "roles": ["owner"],
-                "user@odata.bind": f"https://graph.microsoft.com/v1.0/users('{sender_id}')"
-            },
-            {
-                "@odata.type": "#microsoft.graph.aadUserConversationMember",
-                "roles": ["owner"],
-                "user@odata.bind": f"https://graph.microsoft.com/v1.0/users('{recipient_id}')"
-            }
-        ]
-    }
-    resp = requests.post(url, headers=headers, json=payload)
+def _batch_fetch_user_ids(client: httpx.Client, access_token: str, user_upns: list):
+    # $batch accepts up to 20 sub-requests; sub-request ids are used to map responses back to UPNs.
+    # Returns None when $batch itself is not supported so the caller can fall back to single GETs;
+    # any other failure (e.g. 401/403) is raised.
+    headers = _auth_headers(access_token)
+    user_ids = {}
+    pending = list(user_upns)
+    for attempt in range(MAX_RETRIES + 1):
+        payload = {
+            "requests": [
+                {"id": str(i), "method": "GET", "url": "/" + _user_path(upn)}
+                for i, upn in enumerate(pending)
+            ]
+        }
+        resp = _request(client, "POST", _BATCH_URL, headers=headers, content=orjson.dumps(payload))
+        if resp.status_code in BATCH_UNSUPPORTED_STATUSES:
+            return None
+        if resp.status_code != 200:
+            raise RuntimeError(f"Failed to resolve users: {resp.status_code} {resp.text}")
+        # Graph throttles sub-requests individually (status 429 plus its own Retry-After), so
+        # re-send only those, after the longest delay any of them asked for.
+        throttled = []
+        delay = 0.0
+        for item in resp.json().get("responses", []):
+            upn = pending[int(item["id"])]
+            status = item.get("status")
+            if status == 200:
+                user_ids[upn] = item["body"].get("id")
+            elif _should_retry("GET", status) and attempt < MAX_RETRIES:
+                throttled.append(upn)
+                delay = max(delay, _retry_delay(item.get("headers", {}), attempt))
+            else:
+                raise RuntimeError(f"Failed to resolve user '{upn}': {status} {item.get('body')}")
+        if not throttled:
+            break
+        time.sleep(delay)
+        pending = throttled
+    unresolved = [upn for upn in user_upns if not user_ids.get(upn)]
+    if unresolved:
+        raise RuntimeError(f"Graph $batch returned no id for: {', '.join(unresolved)}")
+    return user_ids
+
+
+def get_user_ids(client: httpx.Client, access_token: str, user_upns: list) -> dict:
+    """Resolve several UPNs to object ids, fetching all cache misses in one Graph $batch call."""
+    cache = _load_graph_cache()
+    user_ids = {upn: _cached_user_id(cache, upn) for upn in user_upns}
+    missing = [upn for upn, user_id in user_ids.items() if not user_id]
+    if not missing:
+        return user_ids
+
+    if len(missing) == 1:
+        fetched = {missing[0]: _fetch_user_id(client, access_token, missing[0])}
+    else:
+        fetched = _batch_fetch_user_ids(client, access_token, missing)
+    if fetched is None:
+        # The lookups are independent and I/O-bound, so overlap them; httpx.Client is
+        # thread-safe and multiplexes both requests over the shared HTTP/2 connection.
+        with ThreadPoolExecutor(max_workers=min(len(missing), 4)) as executor:
+            ids = executor.map(lambda upn: _fetch_user_id(client, access_token, upn), missing)
+            fetched = dict(zip(missing, ids))
+
+    for upn, user_id in fetched.items():
+        user_ids[upn] = user_id
+        cache["users"][upn] = {"id": user_id, "ts": time.time()}
+    _save_graph_cache(cache)
+    return user_ids
+
+
+def create_chat(client: httpx.Client, access_token: str, sender_id: str, recipient_id: str) -> str:
+    url = _CHATS_URL
+    headers = _auth_headers(access_token)
+    # Object ids are GUIDs, so they can be substituted into the pre-serialized body without escaping.
+    payload = (_CHAT_TEMPLATE % (sender_id, recipient_id)).encode()
+    resp = _request(client, "POST", url, headers=headers, content=payload)
     if resp.status_code in (201, 200):
         return resp.json().get("id")
     raise RuntimeError(f"Failed to create chat: {resp.status_code} {resp.text}")
 
 
-def send_chat_message(access_token: str, chat_id: str, message: str) -> dict:
-    url = GRAPH_RESOURCE + f"v1.0/chats/{chat_id}/messages"
-    headers = {"Authorization": f"Bearer {access_token}", "Content-Type": "application/json"}
-    payload = {"body": {"contentType": "html", "content": message}}
-    resp = requests.post(url, headers=headers, json=payload)
+def get_or_create_chat(client: httpx.Client, access_token: str, sender_id: str, recipient_id: str,
+                       refresh: bool = False) -> str:
+    # Graph returns the same id for a 1:1 chat between two users, so remember it per member pair
+    # and skip the chat-creation POST on later runs. `refresh` forces a new lookup.
+    cache = _load_graph_cache()
+    key = ":".join(sorted([sender_id, recipient_id]))
+    if not refresh and key in cache["chats"]:
+        return cache["chats"][key]
+    chat_id = create_chat(client, access_token, sender_id, recipient_id)
+    cache["chats"][key] = chat_id
+    _save_graph_cache(cache)
+    return chat_id
+
+
+def _message_payload(message: str) -> bytes:
+    body = _MESSAGE_BODY.copy()
+    body["content"] = message
+    return orjson.dumps({"body": body})
+
+
+def _message_result(resp, chat_id: str) -> dict:
+    # Shared by the sync and async send paths.
     if resp.status_code in (201, 200):
         return resp.json()
+    if resp.status_code == 404:
+        raise ChatNotFoundError(f"Chat '{chat_id}' not found: {resp.status_code} {resp.text}")
     raise RuntimeError(f"Failed to send message: {resp.status_code} {resp.text}")
 
 
+def send_chat_message(client: httpx.Client, access_token: str, chat_id: str, message: str) -> dict:
+    url = _CHAT_MESSAGES_URL.format(chat_id)
+    headers = _auth_headers(access_token)
+    resp = _request(client, "POST", url, headers=headers, content=_message_payload(message))
+    return _message_result(resp, chat_id)
+
+
+async def send_chat_message_async(client: httpx.AsyncClient, access_token: str, chat_id: str, message: str) -> dict:
+    url = _CHAT_MESSAGES_URL.format(chat_id)
+    headers = _auth_headers(access_token)
+    content = _message_payload(message)
+    # Same policy as _request: a throttled POST was not processed and can be replayed.
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            resp = await client.post(url, headers=headers, content=content)
+        except httpx.TransportError as exc:
+            if not _should_retry_error("POST", exc) or attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(_retry_delay({}, attempt))
+            continue
+        if not _should_retry("POST", resp.status_code, resp.headers) or attempt == MAX_RETRIES:
+            break
+        await asyncio.sleep(_retry_delay(resp.headers, attempt))
+    return _message_result(resp, chat_id)
+
+
+async def send_chat_messages(access_token: str, chat_id: str, messages: list) -> list:
+    """Send several messages concurrently, multiplexed as HTTP/2 streams over one connection.
+
+    Returns one entry per message, in order: the sent message, or the exception that send raised,
+    so one failure does not hide the ids of messages that were delivered.
+    """
+    async with httpx.AsyncClient(http2=True, timeout=GRAPH_TIMEOUT, limits=GRAPH_LIMITS) as client:
+        return await asyncio.gather(
+            *[send_chat_message_async(client, access_token, chat_id, message) for message in messages],
+            return_exceptions=True,
+        )
+
+
+def _send_all(client: httpx.Client, access_token: str, chat_id: str, messages: list) -> list:
+    # One entry per message, like send_chat_messages; ChatNotFoundError is returned rather than
+    # raised on both paths so main() can re-send just the affected messages. `client` is only
+    # used for a single message; several go through send_chat_messages' own AsyncClient.
+    if len(messages) == 1:
+        try:
+            return [send_chat_message(client, access_token, chat_id, messages[0])]
+        except ChatNotFoundError as ex:
+            return [ex]
+    return asyncio.run(send_chat_messages(access_token, chat_id, messages))
+
+
 def main():
+    threading.Thread(target=_prefetch_dns, daemon=True).start()
     try:
-        load_dotenv()
-
-        client_id = os.getenv("TEAMS_CLIENT_ID")
-        client_secret = os.getenv("TEAMS_CLIENT_SECRET")
-        tenant_id = os.getenv("TEAMS_TENANT_ID")
-        sender_upn = os.getenv("TEAMS_SENDER_UPN")
-        recipient_upn = os.getenv("TEAMS_RECIPIENT_UPN")
-        default_message = os.getenv("TEAMS_DEFAULT_MESSAGE", "Hello from ACS Lab")
-        auth_mode = os.getenv("TEAMS_AUTH_MODE", "app").lower()
+        client_id = config.TEAMS_CLIENT_ID
+        client_secret = config.TEAMS_CLIENT_SECRET
+        tenant_id = config.TEAMS_TENANT_ID
+        sender_upn = config.TEAMS_SENDER_UPN
+        recipient_upn = config.TEAMS_RECIPIENT_UPN
+        default_message = config.TEAMS_DEFAULT_MESSAGE
+        auth_mode = config.TEAMS_AUTH_MODE
 
-        if not all([client_id, client_secret, tenant_id, recipient_upn]):
+        if not all([client_id, client_secret, tenant_id, sender_upn, recipient_upn]):
             raise ValueError("Missing one or more required TEAMS_ environment variables. See .env for stubs.")
+        # A 1:1 chat needs two distinct members; Graph rejects anything else, so fail before
+        # spending any round-trips.
+        if sender_upn.lower() == recipient_upn.lower():
+            raise ValueError("TEAMS_SENDER_UPN and TEAMS_RECIPIENT_UPN must be different users.")
 
         # Choose authentication method based on auth mode
         if auth_mode == "delegated":
@@ -126,29 +441,34 @@ def main():
         else:
             access_token = get_access_token(tenant_id, client_id, client_secret)
 
-        # Resolve user ids
-        if sender_upn:
-            sender_id = get_user_id(access_token, sender_upn)
-        else:
-            print("No TEAMS_SENDER_UPN set; the application will create the chat on behalf of the app if permitted.")
-            sender_id = None
-
-        recipient_id = get_user_id(access_token, recipient_upn)
+        # One HTTP/2 client for user resolution, chat creation and single-message sends, so those
+        # share a connection to graph.microsoft.com instead of a TCP + TLS handshake per request.
+        # Several messages are sent by send_chat_messages on its own AsyncClient connection.
+        with create_graph_client() as client:
+            # Resolve user ids (one $batch round-trip for whatever is not cached yet)
+            user_ids = get_user_ids(client, access_token, [sender_upn, recipient_upn])
+            sender_id = user_ids[sender_upn]
+            recipient_id = user_ids[recipient_upn]
 
-        # If sender_id is provided, create a chat with both users; otherwise try to create a chat with just the recipient
-        if sender_id:
-            chat_id = create_chat(access_token, sender_id, recipient_id)
-        else:
-            # Attempt to create a one-on-one chat where the app is implicitly the initiator. This requires application-level permissions.
-            chat_id = create_chat(access_token, recipient_id, recipient_id)
+            chat_id = get_or_create_chat(client, access_token, sender_id, recipient_id)
 
-        message_text = default_message
-        # allow override via CLI arg
-        if len(sys.argv) > 1:
-            message_text = sys.argv[1]
+            # allow override via CLI args; several args are sent concurrently
+            messages = sys.argv[1:] or [default_message]
 
-        result = send_chat_message(access_token, chat_id, message_text)
-        print("Message sent. Message id:", result.get("id"))
+            results = _send_all(client, access_token, chat_id, messages)
+            stale = [i for i, result in enumerate(results) if isinstance(result, ChatNotFoundError)]
+            if stale:
+                # The cached chat id is stale; create the chat again and re-send, once, only the
+                # messages that hit it so delivered ones are not posted twice.
+                chat_id = get_or_create_chat(client, access_token, sender_id, recipient_id, refresh=True)
+                retried = _send_all(client, access_token, chat_id, [messages[i] for i in stale])
+                for i, result in zip(stale, retried):
+                    results[i] = result
+            for result in results:
+                if isinstance(result, Exception):
+                    print("Error:", result)
+                else:
+                    print("Message sent. Message id:", result.get("id"))
 
     except Exception as ex:
         print("Error:", ex)